@@ -0,0 +1,37 @@
+"""
+Utilidades compartidas por los smoke tests para procesar respuestas MCP.
+"""
+import json
+from typing import Any
+
+
+def extract_payload(result) -> Any:
+    """Extrae el primer payload (json/text) de un resultado call_tool.
+
+    Usa un único model_dump() del SDK (pydantic) y accede por claves de dict,
+    en lugar de sondear atributo por atributo con getattr en cada bloque de
+    contenido. Antes cada smoke test tenía su propia copia de esta función y
+    las versiones estaban empezando a divergir.
+    """
+    if hasattr(result, "model_dump"):
+        d = result.model_dump()
+    else:
+        d = {"content": getattr(result, "content", [])}
+    for c in d.get("content") or ():
+        if not isinstance(c, dict):
+            c = c.model_dump() if hasattr(c, "model_dump") else {}
+        ctype = c.get("type")
+        if ctype == "json":
+            data = c.get("data")
+            if isinstance(data, dict) and "result" in data:
+                return data["result"]
+            return data
+        if ctype == "text":
+            txt = c.get("text")
+            if isinstance(txt, str) and txt.lstrip().startswith("{"):
+                try:
+                    return json.loads(txt)
+                except Exception:
+                    return txt
+            return txt
+    return None
@@ -14,29 +14,164 @@ Notas:
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
 import os
-import sys
 import re
+import sys
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
 
-from colorama import Fore, Style, init as colorama_init
 from mcp.client.session import ClientSession
 from mcp.client.stdio import stdio_client, StdioServerParameters
 
+from client._mcp_util import extract_payload
+
+# orjson (opcional) acelera ~3-5× el serialize/parse del loop del planner;
+# si no está instalado se usa el json de la stdlib con el mismo comportamiento.
 try:
-    from openai import OpenAI  # OpenAI SDK v1
-except Exception:  # pragma: no cover
-    OpenAI = None  # type: ignore
+    import orjson as _orjson
+except ImportError:  # pragma: no cover
+    _orjson = None  # type: ignore
+
+
+def _json_dumps(obj: Any) -> str:
+    if _orjson is not None:
+        return _orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _json_dumps_sorted(obj: Any) -> str:
+    if _orjson is not None:
+        return _orjson.dumps(obj, option=_orjson.OPT_SORT_KEYS).decode()
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False)
+
+
+def _json_loads(s: Any) -> Any:
+    if _orjson is not None:
+        return _orjson.loads(s)
+    return json.loads(s)
+
+# openai y colorama se importan de forma perezosa (en LLM.__init__ y main):
+# arrastran ~100 ms de imports transitivos (httpx, pydantic, anyio) que los
+# smoke tests que no tocan el LLM no deberían pagar.
+
+
+class _NoColor:
+    """Shim sin-op para Fore/Style cuando colorama no fue inicializado."""
+
+    def __getattr__(self, _name: str) -> str:
+        return ""
+
+
+Fore: Any = _NoColor()
+Style: Any = _NoColor()
+
+
+def _init_colors() -> None:
+    """Importa e inicializa colorama, reemplazando los shims del módulo."""
+    global Fore, Style
+    try:
+        import colorama
+        colorama.init()
+        Fore, Style = colorama.Fore, colorama.Style
+    except Exception:
+        pass  # sin colorama, los shims dejan la salida sin color
+
+# Timeouts de streaming: acotan la latencia por paso a segundos en lugar de los
+# 600 s de timeout por defecto del SDK si una request queda colgada.
+STREAM_CHUNK_TIMEOUT = 10.0  # máximo entre chunks (incluye el primero)
+MAX_STREAM_RETRIES = 3
+
+# Límites del historial del planner: sin ellos, cada resultado de tool se
+# reenvía completo en todos los pasos siguientes y el costo crece ~O(N²).
+MAX_TOOL_RESULT_CHARS = 4096   # resultados más grandes se resumen en el historial
+MAX_HISTORY_MESSAGES = 8       # ventana deslizante (siempre se preserva el prefijo estático)
+
+# Tools deterministas de sólo lectura: sus resultados se pueden cachear por
+# (tool, argumentos) durante un TTL corto, evitando roundtrips MCP repetidos.
+READ_ONLY_TOOLS = frozenset({
+    "list_timesheets",
+    "get_timesheet",
+    "get_timesheet_fields_info",
+    "list_projects",
+    "list_time_entries",
+    "export_timesheets",
+})
+TOOL_CACHE_TTL = 30.0
+TOOL_CACHE_MAXSIZE = 128
+
+
+class ToolResultCache:
+    """Cache LRU con TTL para resultados de tools de sólo lectura.
+
+    Cualquier mutación (create/update/delete) debe invalidar el cache completo
+    vía clear(); el TTL corto acota además la ventana de datos potencialmente
+    desactualizados si el servidor cambia por fuera de esta sesión.
+    """
 
+    def __init__(self, ttl: float = TOOL_CACHE_TTL, maxsize: int = TOOL_CACHE_MAXSIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
 
-@dataclass
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        ts, value = item
+        if time.monotonic() - ts > self.ttl:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+# Prompt de sistema del planner. Constante de módulo para que el prefijo enviado
+# al proveedor sea byte-idéntico en cada llamada y aproveche el prompt caching
+# automático (OpenAI cachea por prefijo literal).
+# Las tools se declaran de forma nativa (parámetro `tools` de la API), así que
+# el modelo responde con `tool_calls` estructurados en lugar de JSON en texto.
+PLANNER_SYS_PROMPT = (
+    "Eres un planner que decide acciones usando tools MCP. "
+    "Cuando necesites datos o ejecutar una operación, llama a la tool correspondiente. "
+    "Cuando tengas todo lo necesario, responde al usuario con texto normal."
+)
+
+# Instrucciones persistentes del asistente (no dependen del turno del usuario).
+# Se envían como primer mensaje de usuario, idénticas en cada llamada, para que
+# el proveedor pueda cachear el prefijo completo (system + instrucciones + tools).
+PLANNER_INSTRUCTIONS = (
+    "Eres un asistente de timesheets (PF). Tu única función es crear, listar, actualizar, eliminar y exportar registros de tiempo, "
+    "usando exclusivamente las tools disponibles. "
+    "Para crear o actualizar una tarea (registro), DEBES solicitar al usuario y usar los campos obligatorios de la plantilla PF: "
+    "legajo_personal, fecha, cliente, contrato_division, contrato_tipo, contrato_numero, tarea, tiempo. "
+    "Formatos aceptados: fecha (YYYY-MM-DD o DD/MM/YYYY) y tiempo (HH:MM, minutos enteros o horas decimales como 1.5 o '1.5h'). "
+    "Puedes usar get_timesheet_fields_info para consultar cuáles son los campos obligatorios y opcionales. "
+    "No inventes ni asumas valores por defecto; si falta algún dato obligatorio, primero pregúntalo y NO llames a la tool hasta tenerlo."
+)
+
+
+@dataclass(slots=True)
 class ProviderConfig:
     provider: str  # 'lmstudio' | 'openai'
     model: str
     base_url: Optional[str] = None  # requerido para lmstudio
     api_key: Optional[str] = None   # requerido para openai (o dummy para lmstudio)
+    # Modelo (más chico/barato) para los pasos internos del planner; si es None
+    # se usa `model` para todo. La respuesta final al usuario siempre usa `model`.
+    planner_model: Optional[str] = None
 
 
 def ask_provider() -> ProviderConfig:
@@ -66,70 +201,314 @@ def ask_provider() -> ProviderConfig:
         print(Fore.CYAN + f"Modelo OpenAI [{model}]: " + Style.RESET_ALL, end="")
         m_in = input().strip()
         model = m_in or model
-        return ProviderConfig(provider=p, model=model, api_key=api_key)
+        # Los pasos internos de planificación son clasificación trivial (elegir
+        # tool + argumentos): se pueden rutear a un modelo más chico y barato.
+        planner_model = os.environ.get("OPENAI_PLANNER_MODEL") or "gpt-4o-mini"
+        return ProviderConfig(provider=p, model=model, api_key=api_key, planner_model=planner_model)
+
+
+class LLMCache:
+    """Cache de respuestas del modelo en disco para llamadas deterministas.
+
+    Todas las llamadas del planner usan temperature=0, así que la misma entrada
+    (modelo + mensajes + tools) produce la misma salida: un hit evita por completo
+    el roundtrip de red. Útil sobre todo en desarrollo iterativo, donde los mismos
+    prompts se reenvían una y otra vez.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir or os.path.join(
+            os.path.expanduser("~"), ".cache", "mcp_timesheet", "llm"
+        )
+
+    @staticmethod
+    def key(model: str, messages: List[Dict[str, str]], tools_spec: Optional[List[Dict[str, Any]]]) -> str:
+        payload = _json_dumps_sorted(
+            {"model": model, "messages": messages, "tools": tools_spec, "temperature": 0}
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self._path(key), "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+        except Exception:
+            pass  # el cache es best-effort; nunca debe romper la llamada
+
+
+def _messages_have_tool_error(messages: List[Dict[str, str]]) -> bool:
+    """True si algún resultado de tool en el historial incluye un campo de error.
+
+    Esos fallos no son deterministas (timeouts, estado transitorio), así que no
+    conviene cachear la decisión que el modelo tome a partir de ellos.
+    """
+    for m in messages:
+        content = m.get("content") or ""
+        if m.get("role") == "user" and content.startswith("Resultado de la tool") and '"error"' in content:
+            return True
+    return False
 
 
 class LLM:
     def __init__(self, cfg: ProviderConfig):
-        if OpenAI is None:
-            raise RuntimeError("El paquete openai no está instalado")
+        try:
+            from openai import AsyncOpenAI  # OpenAI SDK v1 (import perezoso)
+        except Exception as e:  # pragma: no cover
+            raise RuntimeError("El paquete openai no está instalado") from e
         if cfg.provider == "lmstudio":
-            self.client = OpenAI(api_key=cfg.api_key, base_url=cfg.base_url)
+            self.client = AsyncOpenAI(api_key=cfg.api_key, base_url=cfg.base_url)
         else:
-            self.client = OpenAI(api_key=cfg.api_key)
+            self.client = AsyncOpenAI(api_key=cfg.api_key)
         self.model = cfg.model
+        self.planner_model = cfg.planner_model or cfg.model
         self.is_lmstudio = cfg.provider == "lmstudio"
+        self.cache = LLMCache()
+        # El mensaje de sistema es invariante: construirlo una sola vez evita
+        # crear el mismo dict en cada paso del planner.
+        self._sys_prompt: Dict[str, str] = {"role": "system", "content": PLANNER_SYS_PROMPT}
+
+    async def _stream_once(
+        self,
+        model: str,
+        full_messages: List[Dict[str, str]],
+        tools_spec: Optional[List[Dict[str, Any]]],
+    ) -> Tuple[str, List[Dict[str, str]]]:
+        """Consume una respuesta en streaming acumulando texto y tool_calls.
 
-    def complete_json(self, messages: List[Dict[str, str]]) -> str:
-        """Obtiene una respuesta del modelo. Se le pide que devuelva SOLO JSON."""
-        sys_prompt = {
-            "role": "system",
-            "content": (
-                "Eres un planner que decide acciones usando tools MCP. Debes SIEMPRE responder con un JSON válido. "
-                "Formato:\n"
-                "{\n  \"action\": \"tool\" | \"final\",\n  \"tool_name\": <string si action=tool>,\n  \"arguments\": <obj si action=tool>,\n  \"content\": <string si action=final>\n}\n"
-                "No incluyas texto fuera del JSON."
-            ),
-        }
-        full_messages = [sys_prompt] + messages
-        resp = self.client.chat.completions.create(
-            model=self.model,
+        Cada chunk (incluido el primero) debe llegar antes de STREAM_CHUNK_TIMEOUT
+        o se lanza asyncio.TimeoutError para que el caller reintente.
+        """
+        stream = await self.client.chat.completions.create(
+            model=model,
             messages=full_messages,
             temperature=0,
-            # response_format={"type": "json_object"},  # muchos servidores compatibles lo soportan
+            tools=tools_spec or None,
+            stream=True,
         )
-        return resp.choices[0].message.content or "{}"
+        parts: List[str] = []
+        calls: Dict[int, Dict[str, Any]] = {}
+        it = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(it.__anext__(), timeout=STREAM_CHUNK_TIMEOUT)
+                except StopAsyncIteration:
+                    break
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta is None:
+                    continue
+                if delta.content:
+                    parts.append(delta.content)
+                for tc in (delta.tool_calls or []):
+                    slot = calls.setdefault(tc.index, {"name": "", "arguments": []})
+                    fn = getattr(tc, "function", None)
+                    if fn is not None:
+                        if fn.name:
+                            slot["name"] = fn.name
+                        if fn.arguments:
+                            slot["arguments"].append(fn.arguments)
+        finally:
+            try:
+                await stream.close()
+            except Exception:
+                pass
+        tool_calls = [
+            {"name": calls[i]["name"], "arguments": "".join(calls[i]["arguments"])}
+            for i in sorted(calls)
+        ]
+        return "".join(parts), tool_calls
 
+    async def plan(
+        self,
+        messages: List[Dict[str, str]],
+        tools_spec: Optional[List[Dict[str, Any]]] = None,
+        role: str = "plan",
+    ) -> Dict[str, Any]:
+        """Obtiene la siguiente acción del modelo usando tool calling nativo.
 
-def parse_json_object(s: str) -> Dict[str, Any]:
-    # intenta parsear un objeto JSON de la respuesta
-    try:
-        return json.loads(s)
-    except Exception:
-        # fallback: extraer el primer {...}
-        start = s.find("{")
-        end = s.rfind("}")
-        if start != -1 and end != -1 and end > start:
+        El prompt de sistema y el prefijo estático (instrucciones + catálogo de tools)
+        deben ir SIEMPRE al principio y sin variaciones: así el proveedor puede
+        servir el prefijo desde su caché de prompts (menos tokens de entrada y TTFT).
+
+        La respuesta se consume en streaming con timeout por chunk y reintentos,
+        de modo que un request colgado no bloquee el loop del agente 600 s.
+
+        Devuelve un dict con el mismo shape de acción que antes:
+        {"action":"tool","tool_name":...,"arguments":{...}} o {"action":"final","content":...}.
+
+        `role` selecciona el tier de modelo: "plan" usa el modelo chico del planner
+        (decidir la próxima tool es clasificación trivial); "final" usa el modelo
+        elegido por el usuario para redactar la respuesta.
+        """
+        model = self.planner_model if role == "plan" else self.model
+        full_messages = [self._sys_prompt, *messages]
+
+        # Las llamadas son deterministas (temperature=0): ante la misma entrada
+        # devolvemos la respuesta cacheada sin tocar la red. No se cachea si el
+        # historial contiene errores de tools (resultado no determinista).
+        cacheable = not _messages_have_tool_error(full_messages)
+        cache_key = self.cache.key(model, full_messages, tools_spec) if cacheable else None
+        if cache_key is not None:
+            hit = self.cache.get(cache_key)
+            if hit is not None:
+                return hit
+
+        last_err: Optional[BaseException] = None
+        for _attempt in range(MAX_STREAM_RETRIES):
             try:
-                return json.loads(s[start : end + 1])
+                content, tool_calls = await self._stream_once(model, full_messages, tools_spec)
+                break
+            except asyncio.TimeoutError as e:
+                last_err = e
+                continue
+        else:
+            raise RuntimeError(
+                f"El modelo no respondió dentro de {STREAM_CHUNK_TIMEOUT}s tras {MAX_STREAM_RETRIES} intentos"
+            ) from last_err
+
+        result: Optional[Dict[str, Any]] = None
+        if tool_calls:
+            call = tool_calls[0]
+            try:
+                arguments = _json_loads(call["arguments"] or "{}")
             except Exception:
+                arguments = {}
+            result = {"action": "tool", "tool_name": call["name"], "arguments": arguments}
+        if result is None:
+            # Fallback: algunos modelos servidos por LM Studio no emiten tool_calls y
+            # responden el JSON de acción como texto; lo aceptamos si tiene el shape esperado.
+            try:
+                obj = parse_json_object(content)
+                if isinstance(obj, dict) and obj.get("action"):
+                    result = obj
+            except ValueError:
                 pass
+        if result is None:
+            result = {"action": "final", "content": content}
+        if cache_key is not None:
+            self.cache.set(cache_key, result)
+        return result
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def parse_json_object(s: str) -> Dict[str, Any]:
+    # intenta parsear un objeto JSON de la respuesta
+    try:
+        return _json_loads(s)
+    except ValueError:
+        pass
+    # fallback: raw_decode desde cada '{' candidato. A diferencia del viejo
+    # find("{")/rfind("}"), parsea en una sola pasada y no se confunde con
+    # llaves dentro de strings ni con prosa antes/después del objeto.
+    i = s.find("{")
+    while i != -1:
+        try:
+            obj, _ = _JSON_DECODER.raw_decode(s, i)
+            if isinstance(obj, dict):
+                return obj
+        except json.JSONDecodeError:
+            pass
+        i = s.find("{", i + 1)
     raise ValueError("No se pudo parsear JSON de la respuesta del modelo")
 
 
+# Ruta rápida: verbos imperativos → tool de lectura sin argumentos obligatorios.
+# Si la instrucción matchea y no hay slots que llenar, se ejecuta la tool directo
+# y se evita el roundtrip (1-6 llamadas) por el LLM.
+_FAST_ROUTES: Tuple[Tuple[Tuple[str, ...], str], ...] = (
+    (("lista", "listar", "listá", "mostra", "mostrar", "mostrá"), "list_timesheets"),
+    (("exporta", "exportar", "exportá", "csv"), "export_timesheets"),
+)
+
+# Verbos de mutación: si aparecen en cualquier parte de la instrucción, hay más
+# intención que un read simple y tiene que resolverla el planner (un falso
+# positivo acá sólo cuesta un roundtrip por el LLM; el caso inverso se saltea
+# silenciosamente parte del pedido).
+_RE_MUTATION = re.compile(r"\b(?:borr|elimin|cre|agreg|cargu|carg|actualiz|cambi|modific|edit)\w*")
+
+
+def _fast_route(user_text: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Router de intención barato para el camino común.
+
+    Sólo rutea cuando la primera palabra de la instrucción es exactamente uno
+    de los verbos de ruta (nada de substrings: "analista" no es "lista"), no
+    hay datos a extraer (fechas, legajos, cantidades: si hay dígitos, el LLM
+    tiene que armar los argumentos) y no aparece ningún verbo de mutación que
+    indique intenciones adicionales. Devuelve (tool_name, arguments) o None si
+    hay que ir al planner.
+    """
+    lowered = user_text.lower()
+    if any(ch.isdigit() for ch in lowered):
+        return None
+    if _RE_MUTATION.search(lowered):
+        return None
+    words = lowered.split()
+    if not words:
+        return None
+    first = words[0].strip("¡!¿?.,;:")
+    for verbs, tool in _FAST_ROUTES:
+        if first in verbs:
+            return tool, {}
+    return None
+
+
+def tools_to_openai_spec(tools: List[Any]) -> List[Dict[str, Any]]:
+    """Convierte las tools MCP al formato nativo `tools` de la API de OpenAI."""
+    spec: List[Dict[str, Any]] = []
+    for t in tools:
+        name = getattr(t, "name", None)
+        if not name:
+            continue
+        schema = getattr(t, "inputSchema", None) or getattr(t, "input_schema", None) or {"type": "object", "properties": {}}
+        spec.append({
+            "type": "function",
+            "function": {
+                "name": name,
+                "description": getattr(t, "description", "") or "",
+                "parameters": schema,
+            },
+        })
+    return spec
+
+
 def pretty_tools(tools: List[Any]) -> str:
+    """Renderiza el catálogo en una línea compacta por tool: `name(param:tipo, ...) — desc`.
+
+    No volcamos el inputSchema JSON completo: el modelo ya recibe los esquemas
+    por el parámetro nativo `tools`, y duplicarlos en el prompt multiplicaba los
+    tokens de entrada de cada paso del planner.
+    """
     lines = []
     for t in tools:
         name = getattr(t, "name", "")
-        desc = getattr(t, "description", "") or ""
+        desc = (getattr(t, "description", "") or "").strip()
+        if desc:
+            desc = desc.splitlines()[0]
         schema = getattr(t, "inputSchema", None) or getattr(t, "input_schema", None)
-        lines.append(f"- {name}: {desc}")
-        if schema:
-            try:
-                schema_str = json.dumps(schema, ensure_ascii=False)
-                lines.append(f"  schema: {schema_str}")
-            except Exception:
-                pass
+        params: List[str] = []
+        if isinstance(schema, dict):
+            props = schema.get("properties") or {}
+            required = set(schema.get("required") or ())
+            for pname, p in props.items():
+                ptype = p.get("type", "any") if isinstance(p, dict) else "any"
+                suffix = "" if pname in required else "?"
+                params.append(f"{pname}{suffix}:{ptype}")
+        lines.append(f"- {name}({', '.join(params)}) — {desc}")
     return "\n".join(lines)
 
 
@@ -148,13 +527,26 @@ async def run_agent(session: ClientSession):
         name = name or ""
         tools_by_name[name] = t
 
+    # Catálogo de tools: invariante tras list_tools, se renderiza UNA sola vez.
+    tools_text = pretty_tools(tools)
+    tools_spec = tools_to_openai_spec(tools)
+
     # Mostrar tools
     print(Fore.YELLOW + "Tools disponibles:" + Style.RESET_ALL)
-    print(pretty_tools(tools))
+    print(tools_text)
 
     cfg = ask_provider()
     llm = LLM(cfg)
 
+    # Prefijo estático cacheable: instrucciones persistentes + catálogo de tools.
+    # Se construye una vez por sesión y va siempre como primer mensaje, de modo
+    # que cada llamada al modelo comparta el mismo prefijo literal.
+    static_prefix: Dict[str, str] = {
+        "role": "user",
+        "content": PLANNER_INSTRUCTIONS + f"\n\nTools disponibles y esquemas:\n{tools_text}",
+    }
+
+    tool_cache = ToolResultCache()
 
     print(Fore.GREEN + "Escribe una instrucción en lenguaje natural (salir/exit para terminar):" + Style.RESET_ALL)
     while True:
@@ -162,37 +554,47 @@ async def run_agent(session: ClientSession):
         user_text = input().strip()
         if not user_text:
             continue
-        if user_text.lower() in {"salir", "exit", "quit"}:
+        lowered = user_text.lower()
+        if lowered in {"salir", "exit", "quit"}:
             print("Hasta luego!")
             break
 
-        messages: List[Dict[str, str]] = []
-        # Proveer catálogo de tools al modelo en el mensaje del usuario
-        tools_text = pretty_tools(tools)
-        messages.append({
-            "role": "user",
-            "content": (
-                "Eres un asistente de timesheets (PF). Tu única función es crear, listar, actualizar, eliminar y exportar registros de tiempo, "
-                "usando exclusivamente las tools: create_timesheet, list_timesheets, update_timesheet, delete_timesheet, export_timesheets, get_timesheet, get_timesheet_fields_info. "
-                "Para crear o actualizar una tarea (registro), DEBES solicitar al usuario y usar los campos obligatorios de la plantilla PF: "
-                "legajo_personal, fecha, cliente, contrato_division, contrato_tipo, contrato_numero, tarea, tiempo. "
-                "Formatos aceptados: fecha (YYYY-MM-DD o DD/MM/YYYY) y tiempo (HH:MM, minutos enteros o horas decimales como 1.5 o '1.5h'). "
-                "Puedes usar get_timesheet_fields_info para consultar cuáles son los campos obligatorios y opcionales. "
-                "No inventes ni asumas valores por defecto; si falta algún dato obligatorio, primero pregúntalo y NO llames a la tool hasta tenerlo. "
-                "Siempre responde SOLO con JSON válido del tipo {\"action\":\"tool\",\"tool_name\":\"...\",\"arguments\":{...}} o {\"action\":\"final\",\"content\":\"...\"}.\n\n"
-                f"Tools disponibles y esquemas:\n{tools_text}\n\n"
-                f"Instrucción del usuario: {user_text}"
-            ),
-        })
+        # Camino común sin ambigüedad: ejecutar la tool directo, sin LLM.
+        routed = _fast_route(lowered)
+        if routed is not None and routed[0] in tools_by_name:
+            tool_name, arguments = routed
+            print(Fore.YELLOW + f"(ruta rápida) {tool_name}" + Style.RESET_ALL)
+            try:
+                result = await session.call_tool(tool_name, arguments=arguments)
+                payload = extract_payload(result)
+            except Exception as e:
+                payload = {"error": str(e)}
+            print(Fore.MAGENTA + "Respuesta final:" + Style.RESET_ALL)
+            print(payload if isinstance(payload, str) else _json_dumps(payload))
+            continue
+
+        # Sólo lo variable va al final: la instrucción del turno y los resultados de tools.
+        messages: List[Dict[str, str]] = [
+            static_prefix,
+            {"role": "user", "content": f"Instrucción del usuario: {user_text}"},
+        ]
 
         # loop de planificación/ejecución (máx 6 pasos)
         tool_context: List[Tuple[str, Any]] = []  # (tool_name, resultado)
         for step in range(6):
-            raw = llm.complete_json(messages)
+            # Ventana deslizante: fijar el prefijo estático (cacheable) Y la
+            # instrucción del usuario, y recortar sólo la cola de intercambios
+            # de tools; si la instrucción se evicta, la redacción final no sabe
+            # qué se le pidió.
+            if len(messages) > MAX_HISTORY_MESSAGES:
+                messages = [messages[0], messages[1], *messages[-(MAX_HISTORY_MESSAGES - 2):]]
+            # Primer paso: decidir la tool (modelo chico). Con resultados de tools
+            # ya en mano, la redacción final usa el modelo elegido por el usuario.
+            role = "plan" if not tool_context else "final"
             try:
-                obj = parse_json_object(raw)
+                obj = await llm.plan(messages, tools_spec, role=role)
             except Exception as e:
-                print(Fore.RED + f"Error parseando JSON del modelo: {e}" + Style.RESET_ALL)
+                print(Fore.RED + f"Error consultando al modelo: {e}" + Style.RESET_ALL)
                 break
 
             action = str(obj.get("action", "")).lower()
@@ -202,35 +604,66 @@ async def run_agent(session: ClientSession):
                 if tool_name not in tools_by_name:
                     print(Fore.RED + f"Tool desconocida: {tool_name}" + Style.RESET_ALL)
                     break
-                # Ejecutar tool via MCP
-                try:
-                    result = await session.call_tool(tool_name, arguments=arguments)
-                    # Unificar resultado legible (json/text)
-                    rendered: Any = []
-                    content_list = getattr(result, "content", [])
-                    for c in content_list:
-                        ctype = getattr(c, "type", None)
-                        if ctype == "json":
-                            rendered.append(getattr(c, "data", None))
-                        elif ctype == "text":
-                            rendered.append(getattr(c, "text", None))
-                        else:
-                            rendered.append(getattr(c, "text", None) or getattr(c, "data", None) or str(c))
-                    if len(rendered) == 1:
-                        rendered = rendered[0]
-                except Exception as e:
-                    rendered = {"error": str(e)}
+                # Ejecutar tool via MCP (los reads idempotentes pasan por el cache)
+                cache_key: Optional[str] = None
+                cached: Optional[Any] = None
+                if tool_name in READ_ONLY_TOOLS:
+                    cache_key = f"{tool_name}:{_json_dumps_sorted(arguments)}"
+                    cached = tool_cache.get(cache_key)
+                if cached is not None:
+                    rendered, rendered_text = cached
+                else:
+                    try:
+                        result = await session.call_tool(tool_name, arguments=arguments)
+                        # Unificar resultado legible (json/text)
+                        rendered = []
+                        # Texto crudo del payload: el servidor ya lo serializó y no
+                        # hace falta volver a pasarlo por json.dumps para el historial.
+                        rendered_text = None
+                        content_list = getattr(result, "content", [])
+                        for c in content_list:
+                            ctype = getattr(c, "type", None)
+                            if ctype == "json":
+                                rendered.append(getattr(c, "data", None))
+                            elif ctype == "text":
+                                rendered.append(getattr(c, "text", None))
+                            else:
+                                rendered.append(getattr(c, "text", None) or getattr(c, "data", None) or str(c))
+                        if len(rendered) == 1:
+                            rendered = rendered[0]
+                            if isinstance(rendered, str) and getattr(content_list[0], "type", None) == "text":
+                                rendered_text = rendered
+                    except Exception as e:
+                        rendered = {"error": str(e)}
+                        rendered_text = None
+                    if cache_key is not None and not (isinstance(rendered, dict) and "error" in rendered):
+                        tool_cache.set(cache_key, (rendered, rendered_text))
+                    elif tool_name not in READ_ONLY_TOOLS:
+                        # Una mutación (create/update/delete) deja obsoleto
+                        # cualquier read cacheado: invalidar todo.
+                        tool_cache.clear()
 
                 tool_context.append((tool_name, rendered))
-                # Añadir contexto de tool al historial y pedir siguiente acción
+                # Añadir contexto de tool al historial y pedir siguiente acción.
+                # Los resultados grandes se resumen: reenviar el payload completo
+                # en cada paso posterior es lo que hace crecer el costo O(N²).
+                rendered_json = rendered_text if rendered_text is not None else _json_dumps(rendered)
+                if len(rendered_json) > MAX_TOOL_RESULT_CHARS:
+                    idx = len(tool_context) - 1
+                    rows = rendered.get("rows") if isinstance(rendered, dict) else None
+                    detalle = f" ({len(rows)} filas)" if isinstance(rows, list) else ""
+                    result_msg = (
+                        f"Resultado de la tool {tool_name} (resumido{detalle}); "
+                        f"muestra: {rendered_json[:500]}… "
+                        f"El resultado completo quedó guardado localmente (tool_context[{idx}])."
+                    )
+                else:
+                    result_msg = f"Resultado de la tool {tool_name}:\n{rendered_json}"
                 messages.append({
                     "role": "assistant",
-                    "content": json.dumps({"action": "tool", "tool_name": tool_name, "arguments": arguments}, ensure_ascii=False),
-                })
-                messages.append({
-                    "role": "user",
-                    "content": "Resultado de la tool {name}:\n".format(name=tool_name) + json.dumps(rendered, ensure_ascii=False),
+                    "content": _json_dumps({"action": "tool", "tool_name": tool_name, "arguments": arguments}),
                 })
+                messages.append({"role": "user", "content": result_msg})
                 continue
             elif action == "final":
                 content = obj.get("content") or "(sin contenido)"
@@ -245,7 +678,7 @@ async def run_agent(session: ClientSession):
 
 
 async def main():
-    colorama_init()
+    _init_colors()
     # Arranca el servidor MCP por stdio: python -m server.server
     # Esto inicia el transporte stdio para el protocolo MCP.
     python_bin = sys.executable
@@ -0,0 +1,36 @@
+"""
+Orquestador de smoke tests: lanza el servidor MCP UNA sola vez y corre todos
+los tests contra la misma ClientSession.
+
+Ejecutar cada smoke test por separado pagaba un arranque de intérprete Python
+(`python -m server.server`) más un handshake MCP por archivo; compartir la
+sesión amortiza ese costo a una sola vez. Cada test sigue siendo ejecutable
+individualmente vía su propio `python -m client.smoke_test_*`.
+"""
+import asyncio
+import sys
+
+from mcp.client.stdio import stdio_client, StdioServerParameters
+from mcp.client.session import ClientSession
+
+from client import (
+    smoke_test,
+    smoke_test_timesheets,
+    smoke_test_missing_fields,
+    smoke_test_pf_timesheets,
+)
+
+
+async def main():
+    python_bin = sys.executable
+    server_module = "server.server"
+    async with stdio_client(StdioServerParameters(command=python_bin, args=["-m", server_module])) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            for mod in (smoke_test, smoke_test_timesheets, smoke_test_missing_fields, smoke_test_pf_timesheets):
+                print(f"===== {mod.__name__} =====")
+                await mod.run(session)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
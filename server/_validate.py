@@ -0,0 +1,207 @@
+"""
+Subset de validación/normalización de timesheets, puro CPU (str/regex/dict).
+
+Separado de db_utils para que el hot loop de la ingesta masiva quede en un
+módulo chico, totalmente tipado y sin dependencias, apto para compilarse con
+mypyc/Cython como server._validate_c; db_utils importa de ese binario si
+existe y cae a esta versión pura Python si no.
+"""
+import re
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple, Union
+
+# Fecha ISO ya normalizada: el caso común (la UI manda YYYY-MM-DD) no debería
+# pagar strptime ni la maquinaria de excepciones en cada validación.
+_RE_ISO = re.compile(r"\d{4}-\d{2}-\d{2}")
+_RE_DMY = re.compile(r"\d{2}/\d{2}/\d{4}")
+
+# Patrones de parse_tiempo compilados a nivel módulo: el cache interno de `re`
+# (512 entradas) se puede evictar en procesos MCP de larga vida, y el lookup en
+# ese cache tampoco es gratis en loops de validación masiva.
+_RE_HOURS_SUFFIX = re.compile(r"\s*\d+(?:[\.,]\d+)?\s*(h|hs)\s*", re.IGNORECASE)
+_RE_NON_NUM = re.compile(r"[^0-9\.,]")
+_RE_INT = re.compile(r"\d+")
+_RE_FLOAT = re.compile(r"\d+(?:[\.,]\d+)?")
+
+_REQUIRED_INPUT_FIELDS: Tuple[str, ...] = (
+    "legajo_personal",
+    "fecha",
+    "cliente",
+    "contrato_division",
+    "contrato_tipo",
+    "contrato_numero",
+    "tarea",
+    "tiempo",
+)
+
+
+def _truncate(s: Optional[str], maxlen: int = 255) -> Optional[str]:
+    if s is None:
+        return None
+    # type is str (no isinstance): evita el chequeo de subclases en el hot
+    # path, y devolver el mismo objeto cuando ya entra en maxlen ahorra una
+    # allocation por string (16 strings por fila en la ingesta masiva —
+    # s[:maxlen] copia siempre, incluso sin truncar).
+    s2 = s if type(s) is str else str(s)
+    return s2 if len(s2) <= maxlen else s2[:maxlen]
+
+
+def _check_ymd(y: str, m: str, d: str) -> None:
+    """Valida que la fecha exista en el calendario (mes 13, 30/02, etc.).
+
+    date() hace el chequeo en C; el try/except sólo se paga en el caso raro de
+    una fecha inválida, así el hot path sigue libre de excepciones.
+    """
+    try:
+        date(int(y), int(m), int(d))
+    except ValueError:
+        raise ValueError("fecha inválida: usa YYYY-MM-DD, DD/MM/YYYY o timestamp")
+
+
+def parse_fecha(value: Union[str, int, float]) -> str:
+    """Acepta YYYY-MM-DD, DD/MM/YYYY o timestamp (segundos). Devuelve YYYY-MM-DD.
+
+    La forma se decide con regex compiladas en vez de encadenar strptime con
+    try/except: levantar y atrapar excepciones como selector de rama es órdenes
+    de magnitud más caro que un fullmatch.
+    """
+    if value is None:
+        raise ValueError("fecha requerida")
+    if isinstance(value, str) and _RE_ISO.fullmatch(value):
+        _check_ymd(value[0:4], value[5:7], value[8:10])
+        return value
+    if isinstance(value, (int, float)):
+        dt = datetime.fromtimestamp(float(value))
+        return dt.strftime("%Y-%m-%d")
+    s = str(value).strip()
+    if _RE_ISO.fullmatch(s):
+        _check_ymd(s[0:4], s[5:7], s[8:10])
+        return s
+    # DD/MM/YYYY de ancho fijo: validar que la fecha exista y reordenar por
+    # slicing.
+    if _RE_DMY.fullmatch(s):
+        _check_ymd(s[6:10], s[3:5], s[0:2])
+        return s[6:10] + "-" + s[3:5] + "-" + s[0:2]
+    # Formas menos comunes (día/mes de un dígito, p.ej. "2025-1-5" o
+    # "5/1/2025"): acá sí vale strptime; el fast path sólo acorta el camino
+    # para las formas normalizadas, nunca achica lo que se acepta.
+    if "-" in s:
+        try:
+            dt = datetime.strptime(s, "%Y-%m-%d")
+            return dt.strftime("%Y-%m-%d")
+        except ValueError:
+            raise ValueError("fecha inválida: usa YYYY-MM-DD, DD/MM/YYYY o timestamp")
+    try:
+        dt = datetime.strptime(s, "%d/%m/%Y")
+        return dt.strftime("%Y-%m-%d")
+    except ValueError:
+        raise ValueError("fecha inválida: usa YYYY-MM-DD, DD/MM/YYYY o timestamp")
+
+
+def parse_tiempo(value: Union[str, int, float]) -> int:
+    """Convierte distintas representaciones a minutos enteros (>0).
+    Acepta:
+    - "H:MM" o "HH:MM"
+    - Entero (minutos)
+    - Flotante u string con sufijo h/hs (horas decimales), p.ej. 1.5, "1.5h"
+    - String numérico entero se interpreta como minutos
+    """
+    if value is None:
+        raise ValueError("tiempo requerido")
+    # Fast path: ya es un entero (minutos), sin pasar por strings ni regex
+    if type(value) is int:
+        if value <= 0:
+            raise ValueError("tiempo debe ser > 0")
+        return value
+    # La forma se decide con predicados (isdigit/fullmatch), nunca con
+    # try/except como selector de rama: las excepciones quedan sólo para
+    # entradas realmente inválidas.
+    if isinstance(value, str):
+        v = value.strip()
+        # HH:MM
+        if ":" in v:
+            parts = v.split(":")
+            if len(parts) != 2 or not parts[0].isdigit() or not parts[1].isdigit():
+                raise ValueError("formato de tiempo inválido")
+            h = int(parts[0])
+            m = int(parts[1])
+            if m >= 60:
+                raise ValueError("formato de tiempo inválido")
+            total = h * 60 + m
+            if total <= 0:
+                raise ValueError("tiempo debe ser > 0")
+            return total
+        # string numérico entero => minutos
+        if _RE_INT.fullmatch(v):
+            total = int(v)
+            if total <= 0:
+                raise ValueError("tiempo debe ser > 0")
+            return total
+        # flotante => horas decimales
+        if _RE_FLOAT.fullmatch(v):
+            hours = float(v.replace(",", "."))
+            total = int(round(hours * 60))
+            if total <= 0:
+                raise ValueError("tiempo debe ser > 0")
+            return total
+        # sufijo h/hs => horas decimales
+        if _RE_HOURS_SUFFIX.fullmatch(v):
+            num = _RE_NON_NUM.sub("", v).replace(",", ".")
+            total = int(round(float(num) * 60))
+            if total <= 0:
+                raise ValueError("tiempo debe ser > 0")
+            return total
+        raise ValueError("tiempo inválido: usa HH:MM, minutos, o horas decimales (e.g., 1.5h)")
+    # numérico directo: int => minutos, float => horas (convención simple)
+    if isinstance(value, int):
+        total = int(value)
+        if total <= 0:
+            raise ValueError("tiempo debe ser > 0")
+        return total
+    if isinstance(value, float):
+        total = int(round(value * 60))
+        if total <= 0:
+            raise ValueError("tiempo debe ser > 0")
+        return total
+    raise ValueError("tiempo inválido: usa HH:MM, minutos, o horas decimales (e.g., 1.5h)")
+
+
+def _row_tuple(payload: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Valida y normaliza un payload a la 16-tupla en el orden de _INSERT_SQL.
+
+    Arma la tupla posicional directamente, sin pasar por un dict intermedio de
+    16 claves que después habría que re-leer campo por campo (dict churn puro
+    en cargas masivas).
+    """
+    for f in _REQUIRED_INPUT_FIELDS:
+        if f not in payload or (isinstance(payload[f], str) and payload[f].strip() == ""):
+            raise ValueError(f"Campo obligatorio faltante: {f}")
+
+    fecha_iso = parse_fecha(payload.get("fecha"))
+    minutos = parse_tiempo(payload.get("tiempo"))
+
+    # Truncar y normalizar strings opcionales
+    def norm(k: str) -> Optional[str]:
+        v = payload.get(k)
+        if v is None:
+            return None
+        return _truncate(str(v))
+
+    return (
+        norm("nombre_personal"),
+        _truncate(str(payload.get("legajo_personal"))),
+        fecha_iso,
+        _truncate(str(payload.get("cliente"))),
+        norm("nombre_cliente"),
+        _truncate(str(payload.get("contrato_division"))),
+        norm("nombre_division"),
+        _truncate(str(payload.get("contrato_tipo"))),
+        norm("nombre_tipo"),
+        _truncate(str(payload.get("contrato_numero"))),
+        norm("nombre_contrato"),
+        _truncate(str(payload.get("tarea"))),
+        norm("nombre_tarea"),
+        int(minutos),
+        norm("observaciones"),
+        norm("categoria"),
+    )
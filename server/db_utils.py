@@ -1,10 +1,27 @@
+import io
 import os
 import sqlite3
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple, Optional, List, Any, Union, Dict
 from contextlib import contextmanager
-import re
 from datetime import datetime, date
 
+# El pipeline de validación (parse_fecha/parse_tiempo/_truncate/_row_tuple) es
+# CPU puro y vive en server/_validate.py; si hay una versión compilada con
+# mypyc (server/_validate_c) se usa esa, con fallback a la pura Python.
+try:
+    from server._validate_c import (  # type: ignore[import-not-found]
+        _row_tuple,
+        _truncate,
+        parse_fecha,
+        parse_tiempo,
+    )
+except ImportError:
+    from server._validate import _row_tuple, _truncate, parse_fecha, parse_tiempo
+
 DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db")
 DB_PATH = os.path.join(DB_DIR, "database.db")
 PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
@@ -16,276 +33,308 @@ def _enable_fk(conn: sqlite3.Connection):
     except Exception:
         pass
 
+def _apply_pragmas(conn: sqlite3.Connection):
+    """Ajustes de rendimiento por conexión.
+
+    WAL + synchronous=NORMAL reducen los fsyncs por commit y permiten lectores
+    concurrentes sin bloquear al writer (journal_mode=WAL queda además grabado
+    en el archivo de la base, así que es persistente entre procesos).
+    """
+    try:
+        conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA mmap_size=268435456;
+            PRAGMA cache_size=-65536;
+            """
+        )
+    except Exception:
+        pass
+
+# Conexión persistente a nivel proceso: abrir/cerrar por tool descarta el page
+# cache, el cache de sentencias preparadas y el mmap del WAL en cada llamada.
+# Las tools de FastMCP por stdio corren serializadas en este proceso, pero el
+# lock queda por seguridad ante usos desde otros hilos.
+_CONN: Optional[sqlite3.Connection] = None
+_CONN_LOCK = threading.Lock()
+
+def _get_conn() -> sqlite3.Connection:
+    global _CONN
+    if _CONN is None:
+        os.makedirs(DB_DIR, exist_ok=True)
+        # cached_statements amplio: el driver reusa el plan preparado por
+        # identidad de texto SQL, y el default (100) se evicta rápido con
+        # todas las tools activas.
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        _enable_fk(conn)
+        _apply_pragmas(conn)
+        _init_schema(conn)
+        _CONN = conn
+    return _CONN
+
 @contextmanager
 def db_connection():
-    os.makedirs(DB_DIR, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    _enable_fk(conn)
-    try:
-        yield conn
-    finally:
-        conn.close()
+    with _CONN_LOCK:
+        yield _get_conn()
 
 def ensure_db():
     """
     Inicializa la base de datos SOLO para el dominio de timesheets (PF).
-    Crea la tabla timesheets e índices.
+
+    El DDL corre al crear la conexión persistente (una vez por proceso), así
+    que alcanza con forzar esa creación; queda como helper explícito para
+    scripts que quieran preparar la base sin llamar a ninguna tool.
     """
-    with db_connection() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS timesheets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre_personal TEXT,
-                legajo_personal TEXT NOT NULL,
-                fecha TEXT NOT NULL, -- YYYY-MM-DD
-                cliente TEXT NOT NULL,
-                nombre_cliente TEXT,
-                contrato_division TEXT NOT NULL,
-                nombre_division TEXT,
-                contrato_tipo TEXT NOT NULL,
-                nombre_tipo TEXT,
-                contrato_numero TEXT NOT NULL,
-                nombre_contrato TEXT,
-                tarea TEXT NOT NULL,
-                nombre_tarea TEXT,
-                tiempo_minutos INTEGER NOT NULL,
-                observaciones TEXT,
-                categoria TEXT,
-                created_at TEXT DEFAULT (datetime('now')),
-                updated_at TEXT DEFAULT (datetime('now'))
-            )
-            """
-        )
-        # Recommended indexes
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_timesheets_legajo ON timesheets(legajo_personal)")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_timesheets_fecha ON timesheets(fecha)")
-        cur.execute(
-            "CREATE INDEX IF NOT EXISTS idx_timesheets_contrato ON timesheets(cliente, contrato_division, contrato_tipo, contrato_numero)"
+    with db_connection():
+        pass
+
+def _init_schema(conn: sqlite3.Connection):
+    """Crea la tabla timesheets e índices (idempotente)."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS timesheets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre_personal TEXT,
+            legajo_personal TEXT NOT NULL,
+            fecha TEXT NOT NULL, -- YYYY-MM-DD
+            cliente TEXT NOT NULL,
+            nombre_cliente TEXT,
+            contrato_division TEXT NOT NULL,
+            nombre_division TEXT,
+            contrato_tipo TEXT NOT NULL,
+            nombre_tipo TEXT,
+            contrato_numero TEXT NOT NULL,
+            nombre_contrato TEXT,
+            tarea TEXT NOT NULL,
+            nombre_tarea TEXT,
+            tiempo_minutos INTEGER NOT NULL,
+            observaciones TEXT,
+            categoria TEXT,
+            created_at TEXT DEFAULT (datetime('now')),
+            updated_at TEXT DEFAULT (datetime('now'))
         )
-        conn.commit()
+        """
+    )
+    # Recommended indexes
+    # Índice compuesto que cubre el filtro típico de list/export
+    # (legajo_personal = ?, fecha BETWEEN ? AND ?) y el ORDER BY fecha, id
+    # con un solo recorrido de índice, sin sort con B-tree temporal.
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_timesheets_legajo_fecha ON timesheets(legajo_personal, fecha, id)"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_timesheets_fecha ON timesheets(fecha)")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_timesheets_contrato ON timesheets(cliente, contrato_division, contrato_tipo, contrato_numero)"
+    )
+    # El compuesto cubre las consultas por legajo solo como prefijo.
+    cur.execute("DROP INDEX IF EXISTS idx_timesheets_legajo")
+    cur.execute("ANALYZE")
+    conn.commit()
 
 # ---- PF Timesheets helpers ----
 
-def _truncate(s: Optional[str], maxlen: int = 255) -> Optional[str]:
-    if s is None:
-        return None
-    s = str(s)
-    return s[:maxlen]
-
-def parse_fecha(value: Union[str, int, float]) -> str:
-    """Acepta YYYY-MM-DD, DD/MM/YYYY o timestamp (segundos). Devuelve YYYY-MM-DD."""
-    if value is None:
-        raise ValueError("fecha requerida")
-    if isinstance(value, (int, float)):
-        dt = datetime.fromtimestamp(float(value))
-        return dt.strftime("%Y-%m-%d")
-    s = str(value).strip()
-    # YYYY-MM-DD
-    try:
-        dt = datetime.strptime(s, "%Y-%m-%d")
-        return dt.strftime("%Y-%m-%d")
-    except Exception:
-        pass
-    # DD/MM/YYYY
-    try:
-        dt = datetime.strptime(s, "%d/%m/%Y")
-        return dt.strftime("%Y-%m-%d")
-    except Exception:
-        pass
-    raise ValueError("fecha inválida: usa YYYY-MM-DD, DD/MM/YYYY o timestamp")
-
 def to_ddmmyyyy(yyyy_mm_dd: str) -> str:
-    dt = datetime.strptime(yyyy_mm_dd, "%Y-%m-%d")
-    return dt.strftime("%d/%m/%Y")
-
-def parse_tiempo(value: Union[str, int, float]) -> int:
-    """Convierte distintas representaciones a minutos enteros (>0).
-    Acepta:
-    - "H:MM" o "HH:MM"
-    - Entero (minutos)
-    - Flotante u string con sufijo h/hs (horas decimales), p.ej. 1.5, "1.5h"
-    - String numérico entero se interpreta como minutos
-    """
-    if value is None:
-        raise ValueError("tiempo requerido")
-    # HH:MM
-    if isinstance(value, str) and ":" in value:
-        parts = value.split(":")
-        if len(parts) != 2:
-            raise ValueError("formato de tiempo inválido")
-        try:
-            h = int(parts[0])
-            m = int(parts[1])
-        except Exception:
-            raise ValueError("formato de tiempo inválido")
-        if h < 0 or m < 0 or m >= 60:
-            raise ValueError("formato de tiempo inválido")
-        total = h * 60 + m
-        if total <= 0:
-            raise ValueError("tiempo debe ser > 0")
-        return total
-    # Sufijos horas
-    if isinstance(value, str) and re.fullmatch(r"\s*\d+(?:[\.,]\d+)?\s*(h|hs)\s*", value, flags=re.IGNORECASE):
-        num = re.sub(r"[^0-9\.,]", "", value)
-        num = num.replace(",", ".")
-        hours = float(num)
-        total = int(round(hours * 60))
-        if total <= 0:
-            raise ValueError("tiempo debe ser > 0")
-        return total
-    # Números
-    try:
-        if isinstance(value, str):
-            v = value.strip()
-            # string numérico entero => minutos
-            if re.fullmatch(r"\d+", v):
-                total = int(v)
-                if total <= 0:
-                    raise ValueError("tiempo debe ser > 0")
-                return total
-            # flotante => horas decimales
-            if re.fullmatch(r"\d+(?:[\.,]\d+)?", v):
-                hours = float(v.replace(",", "."))
-                total = int(round(hours * 60))
-                if total <= 0:
-                    raise ValueError("tiempo debe ser > 0")
-                return total
-        # numérico directo
-        if isinstance(value, (int, float)):
-            # interpretamos minutos si es entero, horas si float (convención simple)
-            if isinstance(value, int):
-                total = int(value)
-                if total <= 0:
-                    raise ValueError("tiempo debe ser > 0")
-                return total
-            else:
-                total = int(round(float(value) * 60))
-                if total <= 0:
-                    raise ValueError("tiempo debe ser > 0")
-                return total
-    except Exception:
-        pass
-    raise ValueError("tiempo inválido: usa HH:MM, minutos, o horas decimales (e.g., 1.5h)")
+    # La base garantiza YYYY-MM-DD: reordenar por slicing evita un ciclo
+    # strptime/strftime por fila exportada.
+    s = yyyy_mm_dd
+    return s[8:10] + "/" + s[5:7] + "/" + s[0:4]
 
 def to_hhmm(mins: int) -> str:
-    if mins is None or int(mins) < 0:
+    if mins is None:
+        raise ValueError("minutos inválidos")
+    total = int(mins)
+    if total < 0:
         raise ValueError("minutos inválidos")
-    h = int(mins) // 60
-    m = int(mins) % 60
+    # divmod hace una sola división en vez de // + % por separado
+    h, m = divmod(total, 60)
     return f"{h:02d}:{m:02d}"
 
-def insert_timesheet(conn: sqlite3.Connection, payload: Dict[str, Any]) -> Dict[str, Any]:
-    required_fields = [
-        "legajo_personal",
-        "fecha",
-        "cliente",
-        "contrato_division",
-        "contrato_tipo",
-        "contrato_numero",
-        "tarea",
-        "tiempo",
-    ]
-    for f in required_fields:
-        if f not in payload or (isinstance(payload[f], str) and payload[f].strip() == ""):
-            raise ValueError(f"Campo obligatorio faltante: {f}")
-
-    fecha_iso = parse_fecha(payload.get("fecha"))
-    minutos = parse_tiempo(payload.get("tiempo"))
-
-    # Truncar y normalizar strings
-    def norm(k: str) -> Optional[str]:
-        v = payload.get(k)
-        if v is None:
-            return None
-        return _truncate(str(v))
-
-    row = {
-        "nombre_personal": norm("nombre_personal"),
-        "legajo_personal": _truncate(str(payload.get("legajo_personal"))),
-        "fecha": fecha_iso,
-        "cliente": _truncate(str(payload.get("cliente"))),
-        "nombre_cliente": norm("nombre_cliente"),
-        "contrato_division": _truncate(str(payload.get("contrato_division"))),
-        "nombre_division": norm("nombre_division"),
-        "contrato_tipo": _truncate(str(payload.get("contrato_tipo"))),
-        "nombre_tipo": norm("nombre_tipo"),
-        "contrato_numero": _truncate(str(payload.get("contrato_numero"))),
-        "nombre_contrato": norm("nombre_contrato"),
-        "tarea": _truncate(str(payload.get("tarea"))),
-        "nombre_tarea": norm("nombre_tarea"),
-        "tiempo_minutos": int(minutos),
-        "observaciones": norm("observaciones"),
-        "categoria": norm("categoria"),
-    }
-
+# SQL "caliente" como constantes de módulo: siempre el mismo string (y el mismo
+# objeto) por llamada, así el cache de sentencias del driver acierta por texto.
+_SELECT_BY_ID_SQL = "SELECT * FROM timesheets WHERE id = ?"
+_DELETE_SQL = "DELETE FROM timesheets WHERE id = ?"
+
+# created_at/updated_at se pasan explícitos (calculados en Python) en lugar de
+# depender del DEFAULT datetime('now'): así la fila insertada se puede devolver
+# desde memoria sin re-consultarla.
+_INSERT_COLUMNS = (
+    "nombre_personal", "legajo_personal", "fecha", "cliente", "nombre_cliente",
+    "contrato_division", "nombre_division", "contrato_tipo", "nombre_tipo",
+    "contrato_numero", "nombre_contrato", "tarea", "nombre_tarea", "tiempo_minutos",
+    "observaciones", "categoria",
+)
+
+_INSERT_SQL = """
+    INSERT INTO timesheets (
+        nombre_personal, legajo_personal, fecha, cliente, nombre_cliente,
+        contrato_division, nombre_division, contrato_tipo, nombre_tipo,
+        contrato_numero, nombre_contrato, tarea, nombre_tarea, tiempo_minutos,
+        observaciones, categoria, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _db_now() -> str:
+    """Mismo formato que el DEFAULT datetime('now') de SQLite (UTC)."""
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+def insert_timesheet(conn: sqlite3.Connection, payload: Dict[str, Any], return_row: bool = True) -> Dict[str, Any]:
+    row = _row_tuple(payload)
+    now = _db_now()
     cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO timesheets (
-            nombre_personal, legajo_personal, fecha, cliente, nombre_cliente,
-            contrato_division, nombre_division, contrato_tipo, nombre_tipo,
-            contrato_numero, nombre_contrato, tarea, nombre_tarea, tiempo_minutos,
-            observaciones, categoria
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            row["nombre_personal"], row["legajo_personal"], row["fecha"], row["cliente"], row["nombre_cliente"],
-            row["contrato_division"], row["nombre_division"], row["contrato_tipo"], row["nombre_tipo"],
-            row["contrato_numero"], row["nombre_contrato"], row["tarea"], row["nombre_tarea"], row["tiempo_minutos"],
-            row["observaciones"], row["categoria"],
-        ),
-    )
+    cur.execute(_INSERT_SQL, (*row, now, now))
     row_id = cur.lastrowid
     conn.commit()
 
-    cur.execute("SELECT * FROM timesheets WHERE id = ?", (row_id,))
-    out = dict(cur.fetchone())
+    if not return_row:
+        return {"id": row_id}
+    # Ya tenemos todos los valores en memoria: armar el dict de retorno sin el
+    # SELECT-by-id duplica de gratis la mitad de las llamadas a SQLite.
+    out: Dict[str, Any] = {"id": row_id}
+    out.update(zip(_INSERT_COLUMNS, row))
+    out["created_at"] = now
+    out["updated_at"] = now
     return out
 
-def list_timesheets(conn: sqlite3.Connection, date_from: Optional[str] = None, date_to: Optional[str] = None, legajo: Optional[str] = None, limit: int = 1000, offset: int = 0) -> Dict[str, Any]:
+def bulk_insert_timesheets(conn: sqlite3.Connection, payloads: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Inserta N timesheets en UNA transacción con executemany.
+
+    Valida/normaliza todos los payloads antes de tocar la base: si alguno es
+    inválido no se inserta ninguno. Amortiza el fsync del commit y el despacho
+    de sentencias, que por fila dominan el costo de la ingesta masiva.
+    """
+    if not payloads:
+        return {"count": 0}
+    now = _db_now()
+    rows = [(*_row_tuple(p), now, now) for p in payloads]
+    cur = conn.cursor()
+    try:
+        cur.executemany(_INSERT_SQL, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"count": len(rows)}
+
+# Orden de columnas de SELECT * (debe seguir al CREATE TABLE de ensure_db).
+# Indexar sqlite3.Row por entero evita la búsqueda por nombre de columna en
+# cada acceso de los loops calientes de list/export.
+_COLUMNS = (
+    "id", "nombre_personal", "legajo_personal", "fecha", "cliente", "nombre_cliente",
+    "contrato_division", "nombre_division", "contrato_tipo", "nombre_tipo",
+    "contrato_numero", "nombre_contrato", "tarea", "nombre_tarea", "tiempo_minutos",
+    "observaciones", "categoria", "created_at", "updated_at",
+)
+_N_COLS = len(_COLUMNS)
+
+# Índices usados por el loop de export
+_IDX_NOMBRE_PERSONAL = 1
+_IDX_LEGAJO_PERSONAL = 2
+_IDX_FECHA = 3
+_IDX_CLIENTE = 4
+_IDX_NOMBRE_CLIENTE = 5
+_IDX_CONTRATO_DIVISION = 6
+_IDX_NOMBRE_DIVISION = 7
+_IDX_CONTRATO_TIPO = 8
+_IDX_NOMBRE_TIPO = 9
+_IDX_CONTRATO_NUMERO = 10
+_IDX_NOMBRE_CONTRATO = 11
+_IDX_TAREA = 12
+_IDX_NOMBRE_TAREA = 13
+_IDX_TIEMPO_MINUTOS = 14
+_IDX_OBSERVACIONES = 15
+_IDX_CATEGORIA = 16
+
+def _row_dict(r: sqlite3.Row) -> Dict[str, Any]:
+    return {k: r[i] for i, k in enumerate(_COLUMNS)}
+
+def _build_filters(date_from: Optional[str], date_to: Optional[str], legajo: Optional[str]) -> Tuple[str, List[Any]]:
+    """Construye la cláusula WHERE compartida por list/iter/export."""
     where: List[str] = []
     params: List[Any] = []
     if legajo:
         where.append("legajo_personal = ?")
         params.append(str(legajo))
     if date_from:
-        date_from = parse_fecha(date_from)
         where.append("fecha >= ?")
-        params.append(date_from)
+        params.append(parse_fecha(date_from))
     if date_to:
-        date_to = parse_fecha(date_to)
         where.append("fecha <= ?")
-        params.append(date_to)
+        params.append(parse_fecha(date_to))
+    suffix = (" WHERE " + " AND ".join(where)) if where else ""
+    return suffix, params
 
-    base_sql = "FROM timesheets"
-    if where:
-        base_sql += " WHERE " + " AND ".join(where)
-
-    count_sql = "SELECT COUNT(*) " + base_sql
-    
+def list_timesheets(conn: sqlite3.Connection, date_from: Optional[str] = None, date_to: Optional[str] = None, legajo: Optional[str] = None, limit: int = 1000, offset: int = 0) -> Dict[str, Any]:
+    where_sql, params = _build_filters(date_from, date_to, legajo)
+    base_sql = "FROM timesheets" + where_sql
     cur = conn.cursor()
-    
-    cur.execute(count_sql, tuple(params))
-    total_count = cur.fetchone()[0]
 
-    sql = "SELECT * " + base_sql + " ORDER BY fecha ASC, id ASC"
-    
+    # limit == -1: todas las filas; con una sola página no hay nada que ganar
+    # con la window function y el COUNT aparte queda más simple.
+    if limit == -1:
+        cur.execute("SELECT COUNT(*) " + base_sql, tuple(params))
+        total_count = cur.fetchone()[0]
+        cur.execute("SELECT * " + base_sql + " ORDER BY fecha ASC, id ASC", tuple(params))
+        rows = [_row_dict(r) for r in cur.fetchall()]
+        return {"rows": rows, "count": total_count}
+
     if limit <= 0:
         limit = 1000
     if offset < 0:
         offset = 0
-        
-    sql += " LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
-    
-    cur.execute(sql, tuple(params))
-    rows = [dict(r) for r in cur.fetchall()]
+
+    # COUNT(*) OVER () resuelve total + página en UN solo recorrido del índice,
+    # en vez de un COUNT previo que escanea el mismo rango.
+    sql = (
+        "SELECT *, COUNT(*) OVER () AS _total "
+        + base_sql
+        + " ORDER BY fecha ASC, id ASC LIMIT ? OFFSET ?"
+    )
+    cur.execute(sql, (*params, limit, offset))
+    raw = cur.fetchall()
+    if raw:
+        # _total es la columna extra (índice _N_COLS); _row_dict sólo copia
+        # las columnas reales, así no hay que borrarla de cada dict.
+        total_count = raw[0][_N_COLS]
+        rows = [_row_dict(r) for r in raw]
+        return {"rows": rows, "count": total_count}
+    rows = []
+    if offset > 0:
+        # Página más allá del final: la window function no devuelve filas,
+        # pero el total real puede ser > 0.
+        cur.execute("SELECT COUNT(*) " + base_sql, tuple(params))
+        total_count = cur.fetchone()[0]
+    else:
+        total_count = 0
     return {"rows": rows, "count": total_count}
 
-def _pf_header_lines() -> List[str]:
+# Cache del encabezado PF: (mtime de la plantilla, líneas). Evita releer y
+# decodificar el CSV de plantilla en cada export; el mtime invalida el cache
+# si la plantilla cambia con el servidor corriendo.
+_PF_HEADER_CACHE: Optional[Tuple[float, str]] = None
+
+def _pf_header_blob() -> str:
+    """Encabezado PF ya unido con '\\n' y newline final, listo para escribir.
+
+    Se cachea el blob unido (no la lista de líneas): el join de 10 strings
+    ocurre una vez por proceso y no una vez por export.
+    """
+    global _PF_HEADER_CACHE
+    try:
+        mtime = os.path.getmtime(PF_TEMPLATE_PATH)
+    except OSError:
+        mtime = -1.0
+    cached = _PF_HEADER_CACHE
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    blob = "\n".join(_read_pf_header_lines()) + "\n"
+    _PF_HEADER_CACHE = (mtime, blob)
+    return blob
+
+def _read_pf_header_lines() -> List[str]:
     # Prefer reading from the provided PF template to match exact characters
     # Try utf-8 first, then latin-1 as fallback (the sample file shows replacement chars in some viewers)
     for enc in ("utf-8", "utf-8-sig", "latin-1"):
@@ -309,36 +358,57 @@ def _pf_header_lines() -> List[str]:
         "T;NOMBRE_PERSONAL;*LEGAJO_PERSONAL;*FECHA;*CLIENTE;NOMBRE CLIENTE;*CONTRATO-DIVISION;NOMBRE DIVISION;*CONTRATO-TIPO; NOMBRE TIPO;*CONTRATO-NUMERO; NOMBRE CONTRATO;*TAREA; NOMBRE TAREA;*TIEMPO;OBSERVACIONES;CATEGORIA",
     ]
 
-def export_timesheets_csv(conn: sqlite3.Connection, date_from: Optional[str] = None, date_to: Optional[str] = None, legajo: Optional[str] = None) -> Dict[str, Any]:
-    result = list_timesheets(conn, date_from, date_to, legajo, limit=-1)
-    rows = result["rows"]
-    out_lines: List[str] = []
-    out_lines.extend(_pf_header_lines())
-
-    # Data rows
-    for r in rows:
-        fields: List[str] = [
-            # 1..16 as per spec
-            r.get("nombre_personal") or "",
-            r.get("legajo_personal") or "",
-            to_ddmmyyyy(r.get("fecha")),
-            r.get("cliente") or "",
-            r.get("nombre_cliente") or "",
-            r.get("contrato_division") or "",
-            r.get("nombre_division") or "",
-            r.get("contrato_tipo") or "",
-            r.get("nombre_tipo") or "",
-            r.get("contrato_numero") or "",
-            r.get("nombre_contrato") or "",
-            r.get("tarea") or "",
-            r.get("nombre_tarea") or "",
-            to_hhmm(int(r.get("tiempo_minutos") or 0)),
-            r.get("observaciones") or "",
-            r.get("categoria") or "",
-        ]
-        line = "D;" + ";".join(fields)
-        out_lines.append(line)
+def iter_timesheets(conn: sqlite3.Connection, date_from: Optional[str] = None, date_to: Optional[str] = None, legajo: Optional[str] = None):
+    """Itera filas de timesheets directamente desde el cursor, sin fetchall.
 
+    Mismo filtro y orden que list_timesheets; pensado para exports grandes donde
+    materializar la lista completa triplicaría la memoria.
+    """
+    where_sql, params = _build_filters(date_from, date_to, legajo)
+    sql = "SELECT * FROM timesheets" + where_sql + " ORDER BY fecha ASC, id ASC"
+    cur = conn.cursor()
+    cur.execute(sql, tuple(params))
+    yield from cur
+
+# Pool chico para sacar la escritura del CSV del camino de respuesta MCP.
+_IO_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="csv-io")
+
+# Fallas de escrituras en background, por path destino: la tool ya respondió
+# cuando el write corre, así que el error se loguea a stderr (stdout es el
+# transporte MCP) y el próximo export del mismo path lo reporta al cliente.
+_WRITE_ERRORS: Dict[str, str] = {}
+
+def _write_atomic(path: str, content: str) -> None:
+    """Escribe a un tmp único y renombra: nunca se ve un export a medio escribir.
+
+    El nombre temporal sale de mkstemp para que dos exports concurrentes al
+    mismo filename no intercalen escrituras en un mismo .tmp.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        # mkstemp crea 0600 y el rename lo preserva; los exports son para que
+        # el usuario los levante y suba, así que restauramos los permisos que
+        # daría un open() normal (0666 menos el umask del proceso).
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def _note_write_result(path: str, fut) -> None:
+    exc = fut.exception()
+    if exc is not None:
+        _WRITE_ERRORS[path] = str(exc)
+        print(f"[export] error escribiendo {path}: {exc}", file=sys.stderr)
+
+def export_timesheets_csv(conn: sqlite3.Connection, date_from: Optional[str] = None, date_to: Optional[str] = None, legajo: Optional[str] = None, include_content: bool = False) -> Dict[str, Any]:
     # Filename
     base_dt: date
     if date_from:
@@ -349,21 +419,51 @@ def export_timesheets_csv(conn: sqlite3.Connection, date_from: Optional[str] = N
     leg = (legajo or "todos").replace(" ", "_")
     filename = f"PF_PlantillaRegTiempos_{yyyymm}_{leg}.csv"
 
-    content = "\n".join(out_lines) + "\n"
-    # Save to exports directory
     exports_dir = os.path.join(PROJECT_ROOT, "exports")
     os.makedirs(exports_dir, exist_ok=True)
     file_path = os.path.join(exports_dir, filename)
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
 
-    return {"filename": filename, "content": content, "count": len(rows), "saved_path": file_path}
+    # Streaming: cada fila va del cursor a un buffer en memoria; el flush a
+    # disco (tmp + os.replace) queda en el pool de I/O para que la tool
+    # responda apenas termina la lectura de la base, solapando el fsync con
+    # el procesamiento de la respuesta en el cliente.
+    buf = io.StringIO()
+    write = buf.write
+    write(_pf_header_blob())
+    count = 0
+    for r in iter_timesheets(conn, date_from, date_to, legajo):
+        h, m = divmod(int(r[_IDX_TIEMPO_MINUTOS] or 0), 60)
+        # Campos 1..16 según la plantilla, en un único f-string por fila:
+        # sin lista intermedia ni join + concat (1 allocation en vez de ~3).
+        write(
+            f"D;{r[_IDX_NOMBRE_PERSONAL] or ''};{r[_IDX_LEGAJO_PERSONAL] or ''};"
+            f"{to_ddmmyyyy(r[_IDX_FECHA])};{r[_IDX_CLIENTE] or ''};"
+            f"{r[_IDX_NOMBRE_CLIENTE] or ''};{r[_IDX_CONTRATO_DIVISION] or ''};"
+            f"{r[_IDX_NOMBRE_DIVISION] or ''};{r[_IDX_CONTRATO_TIPO] or ''};"
+            f"{r[_IDX_NOMBRE_TIPO] or ''};{r[_IDX_CONTRATO_NUMERO] or ''};"
+            f"{r[_IDX_NOMBRE_CONTRATO] or ''};{r[_IDX_TAREA] or ''};"
+            f"{r[_IDX_NOMBRE_TAREA] or ''};{h:02d}:{m:02d};"
+            f"{r[_IDX_OBSERVACIONES] or ''};{r[_IDX_CATEGORIA] or ''}\n"
+        )
+        count += 1
+
+    content = buf.getvalue()
+    fut = _IO_POOL.submit(_write_atomic, file_path, content)
+    fut.add_done_callback(lambda f, p=file_path: _note_write_result(p, f))
+
+    result: Dict[str, Any] = {"filename": filename, "count": count, "saved_path": file_path}
+    prev_error = _WRITE_ERRORS.pop(file_path, None)
+    if prev_error is not None:
+        result["previous_write_error"] = prev_error
+    if include_content:
+        result["content"] = content
+    return result
 
 # ---- Additional Timesheet CRUD helpers ----
 
 def get_timesheet(conn: sqlite3.Connection, ts_id: int) -> Optional[Dict[str, Any]]:
     cur = conn.cursor()
-    cur.execute("SELECT * FROM timesheets WHERE id = ?", (int(ts_id),))
+    cur.execute(_SELECT_BY_ID_SQL, (int(ts_id),))
     row = cur.fetchone()
     return dict(row) if row else None
 
@@ -408,14 +508,29 @@ def timesheet_fields_info() -> Dict[str, Any]:
     }
     return {"required": required, "optional": optional, "notes": notes}
 
-def update_timesheet(conn: sqlite3.Connection, ts_id: int, payload: Dict[str, Any]) -> Dict[str, Any]:
-    """Update fields for a timesheet. Accepts same keys as insert_timesheet, plus 'tiempo' or 'tiempo_minutos'.
-    Validates that required fields remain present after update.
-    """
-    base = get_timesheet(conn, int(ts_id))
-    if not base:
-        raise ValueError("timesheet no encontrado")
-
+# Plantillas de UPDATE por tupla ordenada de columnas; las columnas salen de
+# la whitelist de campos validados, nunca del payload crudo.
+_UPDATE_SQL_CACHE: Dict[Tuple[str, ...], str] = {}
+
+_SIMPLE_UPDATE_FIELDS = (
+    "nombre_personal",
+    "legajo_personal",
+    "cliente",
+    "nombre_cliente",
+    "contrato_division",
+    "nombre_division",
+    "contrato_tipo",
+    "nombre_tipo",
+    "contrato_numero",
+    "nombre_contrato",
+    "tarea",
+    "nombre_tarea",
+    "observaciones",
+    "categoria",
+)
+
+def _build_updates(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Normaliza un payload de update a dict columna -> valor listo para SQL."""
     updates: Dict[str, Any] = {}
 
     # fecha
@@ -432,29 +547,24 @@ def update_timesheet(conn: sqlite3.Connection, ts_id: int, payload: Dict[str, An
         updates["tiempo_minutos"] = tm
 
     # Simple text fields (truncate)
-    simple_fields = [
-        "nombre_personal",
-        "legajo_personal",
-        "cliente",
-        "nombre_cliente",
-        "contrato_division",
-        "nombre_division",
-        "contrato_tipo",
-        "nombre_tipo",
-        "contrato_numero",
-        "nombre_contrato",
-        "tarea",
-        "nombre_tarea",
-        "observaciones",
-        "categoria",
-    ]
-    for k in simple_fields:
+    for k in _SIMPLE_UPDATE_FIELDS:
         if k in payload:
             v = payload.get(k)
             if v is None:
                 updates[k] = None
             else:
                 updates[k] = _truncate(str(v))
+    return updates
+
+def update_timesheet(conn: sqlite3.Connection, ts_id: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Update fields for a timesheet. Accepts same keys as insert_timesheet, plus 'tiempo' or 'tiempo_minutos'.
+    Validates that required fields remain present after update.
+    """
+    base = get_timesheet(conn, int(ts_id))
+    if not base:
+        raise ValueError("timesheet no encontrado")
+
+    updates = _build_updates(payload)
 
     # Build resulting row for validation
     resulting = dict(base)
@@ -475,24 +585,75 @@ def update_timesheet(conn: sqlite3.Connection, ts_id: int, payload: Dict[str, An
     if not updates:
         return base
 
-    sets: List[str] = []
-    params: List[Any] = []
-    for k, v in updates.items():
-        sets.append(f"{k} = ?")
-        params.append(v)
-    sets.append("updated_at = datetime('now')")
+    now = _db_now()
+    # SQL cacheado por conjunto de columnas: los updates repiten pocas formas
+    # ("sólo tiempo", "sólo observaciones", …) y con el mismo texto SQL el
+    # driver reusa la sentencia preparada en vez de recompilarla por llamada.
+    key = tuple(sorted(updates))
+    sql = _UPDATE_SQL_CACHE.get(key)
+    if sql is None:
+        sql = (
+            "UPDATE timesheets SET "
+            + ", ".join(f"{c} = ?" for c in key)
+            + ", updated_at = ? WHERE id = ?"
+        )
+        _UPDATE_SQL_CACHE[key] = sql
+    params = [updates[c] for c in key]
+    params.append(now)
     params.append(int(ts_id))
 
     cur = conn.cursor()
-    cur.execute(f"UPDATE timesheets SET {', '.join(sets)} WHERE id = ?", tuple(params))
+    cur.execute(sql, tuple(params))
     conn.commit()
-    cur.execute("SELECT * FROM timesheets WHERE id = ?", (int(ts_id),))
-    row = dict(cur.fetchone())
-    return row
+    # `resulting` ya es base + updates validados: devolverlo evita re-leer la fila.
+    resulting["updated_at"] = now
+    return resulting
+
+def bulk_update_timesheets(conn: sqlite3.Connection, ids: List[int], patch: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplica el mismo patch a N timesheets en UNA sola sentencia/transacción.
+
+    Valida el patch una vez y emite un único UPDATE ... WHERE id IN (...),
+    en vez de N llamadas a update_timesheet con una transacción cada una.
+    """
+    if not ids:
+        return {"count": 0}
+    updates = _build_updates(patch)
+    if not updates:
+        return {"count": 0}
+
+    # El patch es uniforme para todas las filas: basta validar que no deje
+    # vacío ningún campo obligatorio que toque.
+    for f in _required_fields_list():
+        if f in updates:
+            v = updates[f]
+            if v is None or (isinstance(v, str) and v.strip() == ""):
+                raise ValueError(f"Campo obligatorio no puede quedar vacío: {f}")
+
+    now = _db_now()
+    id_params = [int(i) for i in ids]
+    sql = (
+        "UPDATE timesheets SET "
+        + ", ".join(f"{c} = ?" for c in sorted(updates))
+        + ", updated_at = ? WHERE id IN ("
+        + ",".join("?" * len(id_params))
+        + ")"
+    )
+    params = [updates[c] for c in sorted(updates)]
+    params.append(now)
+    params.extend(id_params)
+
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, tuple(params))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"count": cur.rowcount}
 
 def delete_timesheet(conn: sqlite3.Connection, ts_id: int) -> bool:
     cur = conn.cursor()
-    cur.execute("DELETE FROM timesheets WHERE id = ?", (int(ts_id),))
+    cur.execute(_DELETE_SQL, (int(ts_id),))
     deleted = cur.rowcount > 0
     conn.commit()
     return deleted
\ No newline at end of file
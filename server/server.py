@@ -13,16 +13,19 @@ proyectos a los que estén asignadas.
 """
 from __future__ import annotations
 
-from typing import Any, Dict, Optional
+import base64
+import gzip
+from typing import Any, Dict, List, Optional
 
 from mcp.server.fastmcp import FastMCP
 from server.db_utils import (
-    ensure_db,
     db_connection,
     insert_timesheet as db_insert_timesheet,
+    bulk_insert_timesheets as db_bulk_insert_timesheets,
     list_timesheets as db_list_timesheets,
     export_timesheets_csv as db_export_timesheets_csv,
     update_timesheet as db_update_timesheet,
+    bulk_update_timesheets as db_bulk_update_timesheets,
     delete_timesheet as db_delete_timesheet,
     get_timesheet as db_get_timesheet,
     timesheet_fields_info as db_timesheet_fields_info,
@@ -81,6 +84,20 @@ def create_timesheet(
         return {"created": False, "error": str(e)}
 
 
+@server.tool()
+def create_timesheets_bulk(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Crea múltiples registros de timesheet en UNA sola transacción.
+    Cada item acepta los mismos campos que create_timesheet. La carga es atómica:
+    si algún item es inválido, no se inserta ninguno.
+    """
+    try:
+        with db_connection() as conn:
+            result = db_bulk_insert_timesheets(conn, items)
+            return {"created": True, "count": result["count"]}
+    except Exception as e:
+        return {"created": False, "error": str(e)}
+
+
 @server.tool()
 def list_timesheets(
     date_from: Optional[str] = None,
@@ -102,14 +119,24 @@ def export_timesheets(
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     legajo: Optional[str] = None,
+    include_content: bool = False,
+    compress: bool = True,
 ) -> Dict[str, Any]:
     """Exporta los registros a un CSV con el formato exacto PF_PlantillaRegTiempos.csv.
-    Retorna { filename, content, count }.
+    El archivo se escribe en la carpeta exports/; retorna { filename, saved_path, count }.
+    Con include_content=True agrega el CSV inline: gzip+base64 en 'content_gz_b64'
+    (o texto plano en 'content' si compress=False). Mandar megabytes de CSV por
+    stdio dentro del JSON-RPC es lo que se quiere evitar por defecto.
     """
     try:
         with db_connection() as conn:
-            result = db_export_timesheets_csv(conn, date_from=date_from, date_to=date_to, legajo=legajo)
-            return result
+            result = db_export_timesheets_csv(
+                conn, date_from=date_from, date_to=date_to, legajo=legajo, include_content=include_content
+            )
+        if include_content and compress:
+            content = result.pop("content", "")
+            result["content_gz_b64"] = base64.b64encode(gzip.compress(content.encode("utf-8"))).decode("ascii")
+        return result
     except Exception as e:
         return {"error": str(e)}
 
@@ -177,6 +204,19 @@ def update_timesheet(
         return {"updated": False, "error": str(e)}
 
 
+@server.tool()
+def update_timesheets_bulk(ids: List[int], patch: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplica el mismo cambio a múltiples registros en UNA sola transacción.
+    `patch` acepta los mismos campos que update_timesheet ('tiempo' o 'tiempo_minutos' incluidos).
+    """
+    try:
+        with db_connection() as conn:
+            result = db_bulk_update_timesheets(conn, ids, patch)
+            return {"updated": True, "count": result["count"]}
+    except Exception as e:
+        return {"updated": False, "error": str(e)}
+
+
 @server.tool()
 def delete_timesheet(id: int) -> Dict[str, Any]:
     """Elimina un registro de timesheet por id."""
@@ -196,9 +236,9 @@ def get_timesheet_fields_info() -> Dict[str, Any]:
     except Exception as e:
         return {"error": str(e)}
 
-# Asegurar que la base está creada al importar/arrancar
-_ = ensure_db()
-
+# La base se inicializa sola (DDL idempotente) al crearse la conexión
+# persistente en la primera tool que la use: importar este módulo no toca
+# disco, lo que abarata spawns repetidos del server por parte de clientes MCP.
 
 if __name__ == "__main__":
     # Inicia el servidor MCP por stdio.